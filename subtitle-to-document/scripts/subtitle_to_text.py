@@ -14,63 +14,129 @@ This file provides convert_subtitles_to_text(...) as the main API.
 Backwards-compatible alias: convert_vtt_to_text(...)
 """
 
+import mmap
+import os
 import re
 import sys
+from itertools import chain
 from pathlib import Path
 
+# Opt-in google-re2 backend for annotation stripping (pip install google-re2).
+# It guarantees linear-time matching on malformed captions but is slower than
+# re on ordinary input, so it is only used when SUBTITLE_TO_TEXT_RE2=1.
+_re2 = None
+if os.environ.get('SUBTITLE_TO_TEXT_RE2', '') not in ('', '0'):
+    try:
+        import re2 as _re2
+    except ImportError:
+        pass
+
 
 # Language-specific configurations
 LANGUAGE_CONFIGS = {
     'en': {
-        'sentence_end': r'[.!?][\s]*$',
+        # A caption ends a sentence when its last non-space character is one of these
+        'sentence_end_chars': frozenset('.!?'),
         'annotations': [
             r'\[(?:Music|Applause|Laughter|Inaudible|.*?)\]',
             r'\((?:Music|Applause|Laughter|Inaudible)\)'
         ],
         'fix_capitalization': True,
+        'cjk_spacing': False,
         'space_join': ' ',
     },
     'zh_tw': {
-        'sentence_end': r'[\u3002\uff01\uff1f][\s]*$',
+        'sentence_end_chars': frozenset('\u3002\uff01\uff1f'),
         'annotations': [
             r'\[(?:\u97f3\u6a02|\u638c\u8072|\u7b11\u8072|\u7121\u6cd5\u807d\u6e05|.*?)\]',
             r'\((?:\u97f3\u6a02|\u638c\u8072|\u7b11\u8072|\u7121\u6cd5\u807d\u6e05)\)',
             r'\[(?:Music|Applause|Laughter|Inaudible|.*?)\]',  # Also support English
         ],
         'fix_capitalization': False,
+        'cjk_spacing': True,
         'space_join': '',  # Chinese doesn't need spaces between words
     },
     'zh_cn': {
-        'sentence_end': r'[\u3002\uff01\uff1f][\s]*$',
+        'sentence_end_chars': frozenset('\u3002\uff01\uff1f'),
         'annotations': [
             r'\[(?:\u97f3\u4e50|\u638c\u58f0|\u7b11\u58f0|\u65e0\u6cd5\u542c\u6e05|.*?)\]',
             r'\((?:\u97f3\u4e50|\u638c\u58f0|\u7b11\u58f0|\u65e0\u6cd5\u542c\u6e05)\)',
             r'\[(?:Music|Applause|Laughter|Inaudible|.*?)\]',  # Also support English
         ],
         'fix_capitalization': False,
+        'cjk_spacing': True,
         'space_join': '',  # Chinese doesn't need spaces between words
     },
 }
 
+_RE_UNICODE_ESCAPE = re.compile(r'\\u([0-9a-fA-F]{4})')
+
+
+def _compile_linear(pattern, ignorecase=False):
+    """Compile with google-re2 (linear-time matching) when enabled, else re."""
+    if _re2 is not None:
+        # RE2 spells \uXXXX as \x{XXXX} and only takes inline flags
+        re2_pattern = _RE_UNICODE_ESCAPE.sub(r'\\x{\1}', pattern)
+        if ignorecase:
+            re2_pattern = '(?i)' + re2_pattern
+        try:
+            return _re2.compile(re2_pattern)
+        except _re2.error:
+            pass
+    return re.compile(pattern, re.IGNORECASE if ignorecase else 0)
+
+
+# Annotation patterns fused into one alternation per language (one scan per caption)
+for _cfg in LANGUAGE_CONFIGS.values():
+    _cfg['annotations_re'] = _compile_linear(
+        '|'.join(f'(?:{p})' for p in _cfg['annotations']), ignorecase=True)
+
+
+def _lang_config(lang):
+    """Resolve a language code to its LANGUAGE_CONFIGS entry (English if unknown).
+
+    An already resolved config dict is returned unchanged, so callers can look
+    the language up once and pass the config through the pipeline.
+    """
+    if isinstance(lang, dict):
+        return lang
+    return LANGUAGE_CONFIGS.get(lang, LANGUAGE_CONFIGS['en'])
+
+
+# Traditional / Simplified Chinese indicator characters for language detection
+_TRAD_SET = frozenset(['\u81fa', '\u7063', '\u7e41', '\u9ad4', '\u61c9', '\u70ba', '\u5011', '\u500b', '\u9019', '\u8aac'])
+_SIMP_SET = frozenset(['\u53f0', '\u6e7e', '\u7b80', '\u4f53', '\u5e94', '\u4e3a', '\u4eec', '\u4e2a', '\u8fd9', '\u8bf4'])
+_RE_NON_CJK = re.compile(r'[^\u4e00-\u9fff]+')
+
+# Pre-compiled patterns shared across calls
+_RE_TAG = re.compile(r'<[^>]+>')
+_RE_SENT_BREAK = re.compile(r'([.!?]\s+)')
+_RE_I_WORD = re.compile(r'\bi\b')
+_RE_I_APOS = re.compile(r"\bi\'")
+_RE_WS = re.compile(r'[ \t]+')
+_RE_MULTI_WS = re.compile(r'[ \t]{2,}')
+_RE_PUNCT_SP = re.compile(r'[ \t]+([,.!?;:])')
+_RE_PUNCT_JOIN = re.compile(r'([,.!?;:])([A-Za-z])')
+
+# Full-width punctuation that should not be preceded by spaces in Chinese text
+_CJK_PUNCT = frozenset('\uff0c\u3002\uff01\uff1f\u3001\uff1b\uff1a')
+
 
 def detect_language(text):
     """
     Detect the primary language of the text.
     Returns: 'en', 'zh_tw', 'zh_cn', default 'en'.
     """
-    if not text:
+    if not text or text.isascii():
         return 'en'
 
-    # Count CJK unified ideographs (basic range)
-    simplified_chars = len(re.findall(r'[\u4e00-\u9fff]', text))
-
-    # Traditional Chinese indicator characters
-    traditional_indicators = ['\u81fa', '\u7063', '\u7e41', '\u9ad4', '\u61c9', '\u70ba', '\u5011', '\u500b', '\u9019', '\u8aac']
-    traditional_count = sum(1 for char in traditional_indicators if char in text)
+    # Count CJK unified ideographs (basic range) by deleting everything else,
+    # which avoids building a list of one-character matches
+    simplified_chars = len(_RE_NON_CJK.sub('', text))
 
-    # Simplified Chinese indicator characters
-    simplified_indicators = ['\u53f0', '\u6e7e', '\u7b80', '\u4f53', '\u5e94', '\u4e3a', '\u4eec', '\u4e2a', '\u8fd9', '\u8bf4']
-    simplified_count = sum(1 for char in simplified_indicators if char in text)
+    # Each indicator character counts once, however often it appears
+    traditional_count = sum(1 for char in _TRAD_SET if char in text)
+    simplified_count = sum(1 for char in _SIMP_SET if char in text)
 
     if simplified_chars > len(text) * 0.3:
         if traditional_count > simplified_count:
@@ -83,17 +149,80 @@ def detect_language(text):
 
 def remove_subtitle_formatting(text):
     """Remove common subtitle formatting tags like <v Speaker>, <c>, <i>, etc."""
-    text = re.sub(r'<v\s+[^>]*>', '', text)
-    text = re.sub(r'</?[^>]+>', '', text)
-    return text
+    if '<' not in text:
+        return text
+    return _RE_TAG.sub('', text)
 
 
 def remove_annotations(text, lang='en'):
-    """Remove common caption annotations based on language."""
-    config = LANGUAGE_CONFIGS.get(lang, LANGUAGE_CONFIGS['en'])
-    for pattern in config['annotations']:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE)
-    return text
+    """Remove common caption annotations based on language (code or config)."""
+    # Every annotation pattern opens with '[' or '('; skip the regex otherwise
+    if '[' not in text and '(' not in text:
+        return text
+    return _lang_config(lang)['annotations_re'].sub('', text)
+
+
+def _read_normalized(fh):
+    """Return the contents of a binary file with newlines normalized to b'\\n'.
+
+    LF-only regular files are memory-mapped instead of read into memory.
+    Files that contain carriage returns, and inputs that cannot be mapped
+    (empty files, pipes, /dev/stdin), are read and normalized in a copy.
+    """
+    try:
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        data = fh.read()
+    else:
+        if mm.find(b'\r') < 0:
+            return mm
+        with mm:
+            data = mm[:]
+    return data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+
+def _iter_blocks(data):
+    """Yield each blank-line separated block of data as a list of its non-blank lines.
+
+    data holds newline-normalized UTF-8 bytes (or an mmap of them). Lines are
+    decoded one at a time, so the whole file is never held as a str.
+    """
+    block = []
+    start = 0
+    n = len(data)
+    while start <= n:
+        end = data.find(b'\n', start)
+        if end < 0:
+            end = n
+        line = data[start:end].decode('utf-8', errors='replace')
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield block
+            block = []
+        start = end + 1
+    if block:
+        yield block
+
+
+def _is_timing_line(line):
+    """Return True for a cue timing line such as '00:00:01.000 --> 00:00:02.000'."""
+    if '-->' not in line:
+        return False
+    first = line.lstrip()[:1]
+    return '0' <= first <= '9'
+
+
+def _cue_text_lines(lines):
+    """Return the caption lines of a cue block, or [] if it has no timing line.
+
+    The timing line is the block's first line, or its second after a cue id.
+    """
+    if _is_timing_line(lines[0]):
+        return lines[1:]
+    if len(lines) > 1 and _is_timing_line(lines[1]):
+        return lines[2:]
+    return []
 
 
 def parse_subtitle_file(sub_path, fmt='auto'):
@@ -102,54 +231,42 @@ def parse_subtitle_file(sub_path, fmt='auto'):
     Returns a tuple: (captions_list, detected_format)
     """
     p = Path(sub_path)
-    raw = p.read_text(encoding='utf-8', errors='replace')
+    with open(p, 'rb') as fh:
+        data = _read_normalized(fh)
+        try:
+            return _parse_blocks(data, p.suffix.lower(), fmt)
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
 
-    normalized = raw.replace('\r\n', '\n').replace('\r', '\n')
-    blocks = re.split(r'\n\s*\n+', normalized)
+def _parse_blocks(data, ext, fmt):
+    """Detect the format of normalized subtitle data and collect its captions."""
+    blocks = _iter_blocks(data)
 
     detected = fmt
     if fmt == 'auto':
-        ext = p.suffix.lower()
-        if ext == '.vtt' or normalized.lstrip().startswith('WEBVTT'):
+        # The first non-blank line starts with WEBVTT iff the document does
+        first = None
+        if ext != '.vtt':
+            first = next(blocks, None)
+            if first is not None:
+                blocks = chain([first], blocks)
+        if ext == '.vtt' or (first is not None and first[0].lstrip().startswith('WEBVTT')):
             detected = 'vtt'
-        elif ext == '.srt' or '-->' in normalized:
+        elif ext == '.srt' or data.find(b'-->') >= 0:
             detected = 'srt'
         else:
             detected = 'vtt'
 
     captions = []
 
-    if detected == 'vtt':
-        timestamp_re = re.compile(r'\d{1,2}:\d{2}:\d{2}[.,]\d{3}\s*-->\s*\d{1,2}:\d{2}:\d{2}[.,]\d{3}')
-        for block in blocks:
-            lines = [ln for ln in block.split('\n') if ln.strip()]
-            if not lines:
+    if detected in ('vtt', 'srt'):
+        is_vtt = detected == 'vtt'
+        for lines in blocks:
+            if is_vtt and (lines[0].startswith('WEBVTT') or lines[0].startswith('NOTE')):
                 continue
-            if lines[0].startswith('WEBVTT') or lines[0].startswith('NOTE'):
-                continue
-            caption_text = []
-            for i, line in enumerate(lines):
-                if timestamp_re.search(line):
-                    caption_text = lines[i+1:]
-                    break
-            if caption_text:
-                text = ' '.join(caption_text)
-                text = remove_subtitle_formatting(text)
-                if text.strip():
-                    captions.append(text.strip())
-
-    elif detected == 'srt':
-        for block in blocks:
-            lines = [ln for ln in block.split('\n') if ln.strip()]
-            if not lines:
-                continue
-            caption_text = []
-            for i, line in enumerate(lines):
-                if '-->' in line:
-                    caption_text = lines[i+1:]
-                    break
-            if not caption_text and len(lines) >= 2 and '-->' in lines[1]:
-                caption_text = lines[2:]
+            caption_text = _cue_text_lines(lines)
             if caption_text:
                 text = ' '.join(caption_text)
                 text = remove_subtitle_formatting(text)
@@ -164,9 +281,12 @@ def remove_duplicates(captions):
     if not captions:
         return captions
     cleaned = [captions[0]]
+    prev_lower = captions[0].lower()
     for caption in captions[1:]:
-        if caption.lower() != cleaned[-1].lower():
+        caption_lower = caption.lower()
+        if caption_lower != prev_lower:
             cleaned.append(caption)
+            prev_lower = caption_lower
     return cleaned
 
 
@@ -177,13 +297,13 @@ def merge_into_paragraphs(captions, lang='en'):
     """
     if not captions:
         return []
-    config = LANGUAGE_CONFIGS.get(lang, LANGUAGE_CONFIGS['en'])
+    end_chars = _lang_config(lang)['sentence_end_chars']
     paragraphs = []
     current = []
-    sentence_end = re.compile(config['sentence_end'])
     for cap in captions:
         current.append(cap)
-        if sentence_end.search(cap):
+        tail = cap.rstrip()
+        if tail and tail[-1] in end_chars:
             paragraphs.append('\n'.join(current))
             current = []
     if current:
@@ -193,38 +313,96 @@ def merge_into_paragraphs(captions, lang='en'):
 
 def fix_capitalization(text, lang='en'):
     """Fix basic capitalization issues (English only)."""
-    config = LANGUAGE_CONFIGS.get(lang, LANGUAGE_CONFIGS['en'])
-    if not config['fix_capitalization']:
+    if not _lang_config(lang)['fix_capitalization']:
         return text
     if text and text[0].islower():
         text = text[0].upper() + text[1:]
-    text = re.sub(r'([.!?]\s+)([a-z])', lambda m: m.group(1) + m.group(2).upper(), text)
-    text = re.sub(r'\bi\b', 'I', text)
-    text = re.sub(r"\bi\'", "I'", text)
+    # Split keeps the breaks at odd indices; capitalize each piece after one
+    parts = _RE_SENT_BREAK.split(text)
+    for i in range(2, len(parts), 2):
+        part = parts[i]
+        if part and 'a' <= part[0] <= 'z':
+            parts[i] = part[0].upper() + part[1:]
+    text = ''.join(parts)
+    text = _RE_I_WORD.sub('I', text)
+    text = _RE_I_APOS.sub("I'", text)
     return text
 
 
+def _squeeze_blanks(run, before_punct):
+    """Normalize a whitespace run found between two non-space characters."""
+    if before_punct:
+        run = run.rstrip(' \t')
+    if len(run) > 1:
+        run = _RE_MULTI_WS.sub(' ', run)
+    return run
+
+
+def _clean_cjk_line(line):
+    """Fix spacing in a Chinese line in a single pass.
+
+    Drops whitespace between two CJK characters and spaces/tabs before
+    full-width punctuation; other runs of spaces/tabs collapse to one space.
+    """
+    out = []
+    run_start = -1
+    prev_cjk = False
+    for i, ch in enumerate(line):
+        if ch.isspace():
+            if run_start < 0:
+                run_start = i
+            continue
+        is_cjk = '\u4e00' <= ch <= '\u9fff'
+        if run_start >= 0:
+            if not (prev_cjk and is_cjk):
+                out.append(_squeeze_blanks(line[run_start:i], ch in _CJK_PUNCT))
+            run_start = -1
+        out.append(ch)
+        prev_cjk = is_cjk
+    if run_start >= 0:
+        out.append(_squeeze_blanks(line[run_start:], False))
+    return ''.join(out)
+
+
 def clean_spacing(text, lang='en'):
     """Fix spacing issues based on language while preserving line breaks."""
+    cjk_spacing = _lang_config(lang)['cjk_spacing']
     lines = text.splitlines()
     cleaned_lines = []
     for line in lines:
         if not line.strip():
             cleaned_lines.append('')
             continue
-        if lang in ['zh_tw', 'zh_cn']:
-            line = re.sub(r'([\u4e00-\u9fff])\s+([\u4e00-\u9fff])', r'\1\2', line)
-            line = re.sub(r'[ \t]{2,}', ' ', line)
-            line = re.sub(r'[ \t]+([\uff0c\u3002\uff01\uff1f\u3001\uff1b\uff1a])', r'\1', line)
+        if cjk_spacing:
+            line = _clean_cjk_line(line)
         else:
-            line = re.sub(r'[ \t]+', ' ', line)
-            line = re.sub(r'[ \t]+([,.!?;:])', r'\1', line)
-            line = re.sub(r'([,.!?;:])([A-Za-z])', r'\1 \2', line)
+            line = _RE_WS.sub(' ', line)
+            line = _RE_PUNCT_SP.sub(r'\1', line)
+            line = _RE_PUNCT_JOIN.sub(r'\1 \2', line)
         cleaned_lines.append(line.strip())
     return '\n'.join(cleaned_lines).strip()
 
 
-def convert_subtitles_to_text(sub_path, output_path=None, lang='auto', fmt='auto'):
+def _clean_captions(captions, config):
+    """Turn parsed captions into cleaned paragraphs for the given language config."""
+    # Strip annotations and drop captions left empty in one pass
+    kept = []
+    for c in captions:
+        c = remove_annotations(c, config).strip()
+        if c:
+            kept.append(c)
+    kept = remove_duplicates(kept)
+
+    cleaned_paragraphs = []
+    for para in merge_into_paragraphs(kept, config):
+        para = fix_capitalization(para, config)
+        para = clean_spacing(para, config)
+        if para:
+            cleaned_paragraphs.append(para)
+    return cleaned_paragraphs
+
+
+def convert_subtitles_to_text(sub_path, output_path=None, lang='auto', fmt='auto', return_text=True):
     """Convert subtitle file (.vtt or .srt) to readable text.
 
     Args:
@@ -232,39 +410,38 @@ def convert_subtitles_to_text(sub_path, output_path=None, lang='auto', fmt='auto
         output_path: Path to output text file (optional)
         lang: Language code ('en', 'zh_tw', 'zh_cn', or 'auto')
         fmt: Subtitle format override ('auto', 'vtt', 'srt')
+        return_text: Build and return the converted text (set False to only
+            write output_path without joining the paragraphs in memory)
 
     Returns:
-        Converted text as a string
+        Converted text as a string, or None when return_text is False
     """
     captions, detected_fmt = parse_subtitle_file(sub_path, fmt=fmt)
 
-    if lang == 'auto':
+    # No captions: skip language detection and every cleaning stage
+    if captions and lang == 'auto':
         sample_text = ' '.join(captions[:10])
         lang = detect_language(sample_text)
         print(f"\U0001F310 Detected language: {lang}")
 
     print(f"\U0001F4CB Detected subtitle format: {detected_fmt}")
 
-    captions = [remove_annotations(c, lang) for c in captions]
-    captions = [c.strip() for c in captions if c.strip()]
-    captions = remove_duplicates(captions)
-    paragraphs = merge_into_paragraphs(captions, lang)
-
-    cleaned_paragraphs = []
-    for para in paragraphs:
-        para = fix_capitalization(para, lang)
-        para = clean_spacing(para, lang)
-        if para:
-            cleaned_paragraphs.append(para)
-
-    final_text = '\n\n'.join(cleaned_paragraphs)
+    cleaned_paragraphs = _clean_captions(captions, _lang_config(lang)) if captions else []
 
+    # Only touch the output file once every paragraph has been cleaned, and
+    # write paragraph by paragraph instead of joining them first
     if output_path:
         with open(output_path, 'w', encoding='utf-8') as f:
-            f.write(final_text)
+            sep = ''
+            for para in cleaned_paragraphs:
+                f.write(sep)
+                f.write(para)
+                sep = '\n\n'
         print(f"\u2705 Converted text saved to: {output_path}")
 
-    return final_text
+    if not return_text:
+        return None
+    return '\n\n'.join(cleaned_paragraphs)
 
 
 # Backwards-compatible alias
@@ -1,6 +1,9 @@
 import importlib.util
+import os
 from pathlib import Path
 
+import pytest
+
 
 def load_module():
     script_path = (
@@ -55,3 +58,120 @@ def test_backwards_alias_matches():
     out_alias = mod.convert_vtt_to_text(vtt)
     out_main = mod.convert_subtitles_to_text(vtt, lang="en", fmt="vtt")
     assert out_alias.strip() == out_main.strip()
+
+
+def test_clean_spacing_chinese():
+    mod = load_module()
+    out = mod.clean_spacing("今天 我們  要 學習 Python  課程 ，好嗎 ？", lang="zh_tw")
+    assert out == "今天我們要學習 Python 課程，好嗎？"
+
+
+def test_vtt_cue_identifiers_skipped(tmp_path):
+    mod = load_module()
+    vtt = tmp_path / "cues.vtt"
+    vtt.write_text(
+        "WEBVTT\n\nNOTE a comment\n\nintro\n00:00:00.000 --> 00:00:01.000\n<v Bob>Hello there.</v>\n\n"
+        "00:00:01.000 --> 00:00:02.000 align:start\nGoodbye.\n",
+        encoding="utf-8",
+    )
+    captions, fmt = mod.parse_subtitle_file(vtt)
+    assert fmt == "vtt"
+    assert captions == ["Hello there.", "Goodbye."]
+
+
+def test_annotation_only_input_returns_empty(tmp_path):
+    mod = load_module()
+    srt = tmp_path / "music.srt"
+    srt.write_text("1\n00:00:00,000 --> 00:00:02,500\n[Music]\n\n2\n00:00:02,500 --> 00:00:05,000\n(Applause)\n", encoding="utf-8")
+    assert mod.convert_subtitles_to_text(srt, lang="en") == ""
+    out = tmp_path / "music.txt"
+    assert mod.convert_subtitles_to_text(srt, out, lang="en") == ""
+    assert out.read_text(encoding="utf-8") == ""
+
+
+def test_return_text_false_writes_file_only(tmp_path):
+    mod = load_module()
+    samples_dir = Path(__file__).resolve().parents[0] / "samples"
+    srt = samples_dir / "sample_en.srt"
+    expected = mod.convert_subtitles_to_text(srt, lang="en", fmt="srt")
+    out = tmp_path / "out.txt"
+    assert mod.convert_subtitles_to_text(srt, out, lang="en", fmt="srt", return_text=False) is None
+    assert out.read_text(encoding="utf-8") == expected
+
+
+def test_arrow_caption_line_is_not_a_cue(tmp_path):
+    mod = load_module()
+    vtt = tmp_path / "arrow.vtt"
+    vtt.write_text(
+        "WEBVTT\n\n00:00:00.000 --> 00:00:01.000\nHello.\n\n--> not a timing line\nstray text\n",
+        encoding="utf-8",
+    )
+    captions, _ = mod.parse_subtitle_file(vtt)
+    assert captions == ["Hello."]
+
+
+def test_re2_backend_matches_re(monkeypatch):
+    pytest.importorskip("re2")
+    monkeypatch.delenv("SUBTITLE_TO_TEXT_RE2", raising=False)
+    mod_re = load_module()
+    monkeypatch.setenv("SUBTITLE_TO_TEXT_RE2", "1")
+    mod_re2 = load_module()
+    assert type(mod_re.LANGUAGE_CONFIGS["en"]["annotations_re"]).__module__ == "re"
+    assert type(mod_re2.LANGUAGE_CONFIGS["en"]["annotations_re"]).__module__.startswith("re2")
+    samples = [
+        "hello (world) [Music] and more text",
+        "[APPLAUSE] thanks (laughter) (Inaudible)",
+        "[a] b [c",
+        "[[[[ unbalanced ]",
+        "音樂 [音樂] (掌聲) (掌声) [笑声] end",
+        "no annotations here",
+    ]
+    for lang in ("en", "zh_tw", "zh_cn"):
+        for text in samples:
+            assert mod_re2.remove_annotations(text, lang) == mod_re.remove_annotations(text, lang)
+
+
+def test_empty_file_parses(tmp_path):
+    mod = load_module()
+    srt = tmp_path / "empty.srt"
+    srt.write_bytes(b"")
+    assert mod.parse_subtitle_file(srt) == ([], "srt")
+
+
+def test_crlf_and_cr_newlines_match_lf(tmp_path):
+    mod = load_module()
+    samples_dir = Path(__file__).resolve().parents[0] / "samples"
+    expected = mod.parse_subtitle_file(samples_dir / "sample_en.srt")
+    raw = (samples_dir / "sample_en.srt").read_bytes()
+    assert b"\r" not in raw
+    for name, newline in (("crlf.srt", b"\r\n"), ("cr.srt", b"\r")):
+        path = tmp_path / name
+        path.write_bytes(raw.replace(b"\n", newline))
+        assert mod.parse_subtitle_file(path) == expected
+
+
+@pytest.mark.skipif(not Path("/dev/fd").is_dir(), reason="needs /dev/fd")
+def test_pipe_input_is_read_without_mmap():
+    mod = load_module()
+    r, w = os.pipe()
+    try:
+        os.write(w, b"1\n00:00:00,000 --> 00:00:01,000\nhello.\n")
+        os.close(w)
+        assert mod.parse_subtitle_file(f"/dev/fd/{r}", fmt="srt") == (["hello."], "srt")
+    finally:
+        os.close(r)
+
+
+def test_no_captions_skips_detection_and_cleaning(tmp_path, monkeypatch):
+    mod = load_module()
+
+    def fail(*args, **kwargs):
+        raise AssertionError("stage should be skipped when there are no captions")
+
+    monkeypatch.setattr(mod, "detect_language", fail)
+    monkeypatch.setattr(mod, "merge_into_paragraphs", fail)
+    vtt = tmp_path / "header_only.vtt"
+    vtt.write_text("WEBVTT\n\nNOTE nothing to see here\n", encoding="utf-8")
+    out = tmp_path / "header_only.txt"
+    assert mod.convert_subtitles_to_text(vtt, out) == ""
+    assert out.read_text(encoding="utf-8") == ""